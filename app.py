@@ -1,11 +1,48 @@
+import os
+import sqlite3
+import tempfile
+
 import streamlit as st
-from db import init_db, run_query, fetch_all, insert_and_get_id
+from audit import diff, log_event, patient_history
+from db import DB_PATH, init_db, run_query, fetch_all, insert_and_get_id, encrypt_values, duplicate_pesel_patients
+from gabinet_streamlit.backup import start_scheduler as start_backup_scheduler
+from db_crypto import UNREADABLE, CryptoError, blind_index, normalize_pesel
+from patient_io import (
+    PATIENT_FIELDS,
+    VISIT_FIELDS,
+    ENCODINGS,
+    UI_EXPORT_MAX_ROWS,
+    DataImportError,
+    export_csv,
+    export_parquet,
+    export_row_count,
+    import_patients,
+    import_visits,
+    read_rows,
+    validate_pesel,
+)
+from templates_store import (
+    TEMPLATE_TYPES,
+    add_template,
+    all_templates,
+    delete_template,
+    duplicate_templates,
+    get_template,
+    render_template,
+    template_names,
+    update_template,
+)
 import pandas as pd
 from datetime import datetime, date
 from fpdf import FPDF
 
 st.set_page_config(page_title="Gabinet lekarski", layout="wide")
-init_db()
+try:
+    init_db()
+except CryptoError as e:
+    st.error(str(e))
+    st.stop()
+start_backup_scheduler(DB_PATH)
 
 # Minimalny „ZnanyLekarz-like” styl
 st.markdown("""
@@ -91,10 +128,36 @@ def generate_visit_pdf(visit_details: pd.Series, diagnoses: pd.DataFrame) -> byt
     pdf_bytes = pdf.output(dest="S").encode("latin-1")
     return pdf_bytes
 
+def fetch_visit_diagnoses(visit_id) -> pd.DataFrame:
+    # kody są zaszyfrowane, więc sortowanie po odszyfrowaniu, nie w SQL
+    diagnoses = fetch_all(
+        "SELECT icd_code, icd_name, is_primary FROM diagnoses WHERE visit_id = ?",
+        (visit_id,),
+    )
+    return diagnoses.sort_values(["is_primary", "icd_code"], ascending=[False, True], ignore_index=True)
+
+
+# ------------------------
+# Helper: dziennik audytu
+# ------------------------
+def diagnoses_text(rows) -> str:
+    return "\n".join(
+        f"{'[GŁÓWNE] ' if primary else ''}{code} – {name}" for code, name, primary in rows
+    )
+
+
+def audit_view(entity: str, entity_id, patient_id):
+    # jeden wpis na wybór rekordu, a nie na każdy przebieg strony
+    key = f"audit_last_view_{entity}"
+    if st.session_state.get(key) != int(entity_id):
+        st.session_state[key] = int(entity_id)
+        log_event(current_user, "view", entity, entity_id, patient_id)
+
 # ------------------------
 # Sidebar – nawigacja
 # ------------------------
 st.sidebar.title("Gabinet")
+current_user = st.sidebar.text_input("Użytkownik (imię i nazwisko)", key="audit_user").strip()
 menu = st.sidebar.radio(
     "Nawigacja",
     [
@@ -105,9 +168,16 @@ menu = st.sidebar.radio(
         "Wizyty – przegląd/edycja",
         "Kalendarz wizyt",
         "Szablony tekstów",
+        "Historia pacjenta",
+        "Import / eksport",
     ]
 )
 
+# strona szablonów nie pokazuje danych pacjentów i nie zapisuje wpisów w dzienniku audytu
+if menu != "Szablony tekstów" and not current_user:
+    st.info("Podaj nazwę użytkownika w panelu bocznym – jest zapisywana w dzienniku audytu.")
+    st.stop()
+
 # ------------------------
 # DASHBOARD
 # ------------------------
@@ -120,6 +190,14 @@ if menu == "Dashboard":
     col1.metric("Liczba pacjentów", n_patients)
     col2.metric("Liczba wizyt", n_visits)
 
+    duplicates = duplicate_pesel_patients()
+    if not duplicates.empty:
+        st.warning(
+            "Ci pacjenci mają ten sam PESEL co inny pacjent (różnica tylko w spacjach) "
+            "i nie są wyszukiwani po numerze PESEL. Wymagają ręcznego scalenia."
+        )
+        st.dataframe(duplicates, use_container_width=True)
+
 # ------------------------
 # NOWY PACJENT – FORMULARZ
 # ------------------------
@@ -130,7 +208,7 @@ elif menu == "Nowy pacjent":
         col1, col2 = st.columns(2)
         with col1:
             first_name = st.text_input("Imię")
-            pesel = st.text_input("PESEL")
+            pesel = normalize_pesel(st.text_input("PESEL"))
             phone = st.text_input("Telefon")
         with col2:
             last_name = st.text_input("Nazwisko")
@@ -147,18 +225,48 @@ elif menu == "Nowy pacjent":
                 errors.append("Brak nazwiska.")
             if not pesel:
                 errors.append("Brak PESEL.")
+            elif not validate_pesel(pesel):
+                errors.append("Niepoprawny numer PESEL.")
             if errors:
                 for e in errors:
                     st.error(e)
             else:
-                run_query(
-                    """
-                    INSERT INTO patients (first_name, last_name, pesel, address, phone, email, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (first_name, last_name, pesel, address, phone, email, datetime.now().isoformat()),
-                )
-                st.success("Pacjent zapisany.")
+                try:
+                    patient_id = insert_and_get_id(
+                        """
+                        INSERT INTO patients (first_name, last_name, pesel, address, phone, email, created_at, pesel_bidx)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            first_name,
+                            last_name,
+                            *encrypt_values((pesel, address, phone, email)),
+                            datetime.now().isoformat(),
+                            blind_index(pesel),
+                        ),
+                    )
+                except sqlite3.IntegrityError:
+                    st.error("Pacjent o tym numerze PESEL już istnieje.")
+                else:
+                    log_event(
+                        current_user,
+                        "create",
+                        "patient",
+                        patient_id,
+                        patient_id,
+                        diff(
+                            {},
+                            {
+                                "first_name": first_name,
+                                "last_name": last_name,
+                                "pesel": pesel,
+                                "address": address,
+                                "phone": phone,
+                                "email": email,
+                            },
+                        ),
+                    )
+                    st.success("Pacjent zapisany.")
 
 # ------------------------
 # LISTA PACJENTÓW + PODGLĄD
@@ -166,21 +274,23 @@ elif menu == "Nowy pacjent":
 elif menu == "Lista pacjentów":
     st.title("Lista pacjentów")
 
-    search = st.text_input("Szukaj (nazwisko / imię / PESEL)")
+    search = st.text_input("Szukaj (nazwisko / imię / pełny PESEL)")
+    # tabela zbiorcza bez odszyfrowanych danych; dane kontaktowe tylko na karcie (wpis w dzienniku)
+    patient_columns = "id, first_name, last_name, pesel, created_at"
     if search:
         like = f"%{search}%"
         patients = fetch_all(
-            """
-            SELECT * FROM patients
-            WHERE last_name LIKE ? OR first_name LIKE ? OR pesel LIKE ?
+            f"""
+            SELECT {patient_columns} FROM patients
+            WHERE last_name LIKE ? OR first_name LIKE ? OR pesel_bidx = ?
             ORDER BY last_name, first_name
             """,
-            (like, like, like),
+            (like, like, blind_index(search)),
         )
     else:
-        patients = fetch_all("SELECT * FROM patients ORDER BY last_name, first_name")
+        patients = fetch_all(f"SELECT {patient_columns} FROM patients ORDER BY last_name, first_name")
 
-    st.dataframe(patients, use_container_width=True)
+    st.dataframe(patients.drop(columns=["pesel"]), use_container_width=True)
 
     if not patients.empty:
         st.subheader("Karta pacjenta")
@@ -190,11 +300,15 @@ elif menu == "Lista pacjentów":
             format_func=lambda p: f"{p.last_name} {p.first_name} ({p.pesel})",
         )
 
+        details = fetch_all(
+            "SELECT address, phone, email FROM patients WHERE id = ?", (selected.id,)
+        ).iloc[0]
         st.write(f"**Imię i nazwisko:** {selected.first_name} {selected.last_name}")
         st.write(f"**PESEL:** {selected.pesel}")
-        st.write(f"**Adres:** {selected.address}")
-        st.write(f"**Telefon:** {selected.phone}")
-        st.write(f"**E-mail:** {selected.email}")
+        st.write(f"**Adres:** {details['address']}")
+        st.write(f"**Telefon:** {details['phone']}")
+        st.write(f"**E-mail:** {details['email']}")
+        audit_view("patient", selected.id, selected.id)
 
         visits = fetch_all(
             """
@@ -226,31 +340,25 @@ elif menu == "Nowa wizyta":
             patients.itertuples(),
             format_func=lambda p: f"{p.last_name} {p.first_name} ({p.pesel})",
         )
-
-        # szablony
-        tpl_int = fetch_all("SELECT id, name, content FROM templates WHERE type = 'interview'")
-        tpl_exam = fetch_all("SELECT id, name, content FROM templates WHERE type = 'examination'")
-        tpl_rec = fetch_all("SELECT id, name, content FROM templates WHERE type = 'recommendations'")
-
-        col_t1, col_t2, col_t3 = st.columns(3)
-        with col_t1:
-            if not tpl_int.empty:
-                opt = ["(brak)"] + tpl_int["name"].tolist()
-                ch = st.selectbox("Szablon wywiadu", opt, key="tpl_int_sel")
-                if ch != "(brak)":
-                    st.session_state["interview_text"] = tpl_int.loc[tpl_int["name"] == ch, "content"].iloc[0]
-        with col_t2:
-            if not tpl_exam.empty:
-                opt = ["(brak)"] + tpl_exam["name"].tolist()
-                ch = st.selectbox("Szablon badania", opt, key="tpl_exam_sel")
-                if ch != "(brak)":
-                    st.session_state["examination_text"] = tpl_exam.loc[tpl_exam["name"] == ch, "content"].iloc[0]
-        with col_t3:
-            if not tpl_rec.empty:
-                opt = ["(brak)"] + tpl_rec["name"].tolist()
-                ch = st.selectbox("Szablon zaleceń", opt, key="tpl_rec_sel")
-                if ch != "(brak)":
-                    st.session_state["recommendations_text"] = tpl_rec.loc[tpl_rec["name"] == ch, "content"].iloc[0]
+        audit_view("patient", selected.id, selected.id)
+
+        # szablony (jeden odczyt z pamięci podręcznej zamiast trzech zapytań)
+        tpl_selectors = [
+            ("interview", "Szablon wywiadu", "tpl_int_sel", "interview_text"),
+            ("examination", "Szablon badania", "tpl_exam_sel", "examination_text"),
+            ("recommendations", "Szablon zaleceń", "tpl_rec_sel", "recommendations_text"),
+        ]
+        for col, (t_type, label, sel_key, text_key) in zip(st.columns(3), tpl_selectors):
+            with col:
+                names = template_names(t_type)
+                if names:
+                    ch = st.selectbox(label, ["(brak)"] + names, key=sel_key)
+                    if ch != "(brak)":
+                        st.session_state[text_key] = render_template(
+                            get_template(t_type, ch)["content"],
+                            patient=selected,
+                            visit_date=date.today(),
+                        )
 
         with st.form("new_visit_form"):
             st.markdown(f"**Pacjent:** {selected.first_name} {selected.last_name} ({selected.pesel})")
@@ -311,10 +419,7 @@ elif menu == "Nowa wizyta":
                         (
                             selected.id,
                             datetime.now().isoformat(),
-                            interview,
-                            examination,
-                            meds_text,
-                            recommendations,
+                            *encrypt_values((interview, examination, meds_text, recommendations)),
                         ),
                     )
 
@@ -324,9 +429,26 @@ elif menu == "Nowa wizyta":
                             INSERT INTO diagnoses (visit_id, icd_code, icd_name, is_primary)
                             VALUES (?, ?, ?, ?)
                             """,
-                            (visit_id, code, name, 1 if primary else 0),
+                            (visit_id, *encrypt_values((code, name)), 1 if primary else 0),
                         )
 
+                    log_event(
+                        current_user,
+                        "create",
+                        "visit",
+                        visit_id,
+                        selected.id,
+                        diff(
+                            {},
+                            {
+                                "interview": interview,
+                                "examination": examination,
+                                "medications": meds_text,
+                                "recommendations": recommendations,
+                                "diagnoses": diagnoses_text(dx_entries),
+                            },
+                        ),
+                    )
                     st.success("Wizyta zapisana.")
 
 # ------------------------
@@ -337,7 +459,7 @@ elif menu == "Wizyty – przegląd/edycja":
 
     colf1, colf2 = st.columns(2)
     with colf1:
-        patient_filter = st.text_input("Filtr pacjenta (nazwisko / PESEL)")
+        patient_filter = st.text_input("Filtr pacjenta (nazwisko / pełny PESEL)")
     with colf2:
         date_from = st.date_input("Od daty", value=None, key="vf_from")
         date_to = st.date_input("Do daty", value=None, key="vf_to")
@@ -352,8 +474,8 @@ elif menu == "Wizyty – przegląd/edycja":
 
     if patient_filter:
         like = f"%{patient_filter}%"
-        query += " AND (p.last_name LIKE ? OR p.first_name LIKE ? OR p.pesel LIKE ?)"
-        params.extend([like, like, like])
+        query += " AND (p.last_name LIKE ? OR p.first_name LIKE ? OR p.pesel_bidx = ?)"
+        params.extend([like, like, blind_index(patient_filter)])
 
     if isinstance(date_from, date):
         query += " AND date(v.date) >= date(?)"
@@ -388,15 +510,8 @@ elif menu == "Wizyty – przegląd/edycja":
             (selected_visit.id,),
         ).iloc[0]
 
-        diagnoses = fetch_all(
-            """
-            SELECT icd_code, icd_name, is_primary
-            FROM diagnoses
-            WHERE visit_id = ?
-            ORDER BY is_primary DESC, icd_code
-            """,
-            (selected_visit.id,),
-        )
+        diagnoses = fetch_visit_diagnoses(selected_visit.id)
+        audit_view("visit", selected_visit.id, visit_details["patient_id"])
 
         st.subheader("Szczegóły wizyty")
         st.markdown(f"**Pacjent:** {visit_details['first_name']} {visit_details['last_name']} ({visit_details['pesel']})")
@@ -465,30 +580,57 @@ elif menu == "Wizyty – przegląd/edycja":
 
             submitted_edit = st.form_submit_button("Zapisz zmiany")
 
-            if submitted_edit:
+            if submitted_edit and UNREADABLE in (interview_edit, exam_edit, meds_edit, rec_edit):
+                st.error("Część danych wizyty nie daje się odszyfrować – zapis został wstrzymany.")
+            elif submitted_edit:
+                dx_after = []
+                for i, (code, name) in enumerate(zip(dx_codes, dx_names)):
+                    code = code.strip()
+                    name = name.strip()
+                    if code and name:
+                        dx_after.append((code, name, i == dx_primary_idx))
+
                 run_query(
                     """
                     UPDATE visits
                     SET interview = ?, examination = ?, medications = ?, recommendations = ?
                     WHERE id = ?
                     """,
-                    (interview_edit, exam_edit, meds_edit, rec_edit, selected_visit.id),
+                    (*encrypt_values((interview_edit, exam_edit, meds_edit, rec_edit)), selected_visit.id),
                 )
                 run_query("DELETE FROM diagnoses WHERE visit_id = ?", (selected_visit.id,))
 
-                for i, (code, name) in enumerate(zip(dx_codes, dx_names)):
-                    code = code.strip()
-                    name = name.strip()
-                    if not code or not name:
-                        continue
+                for code, name, primary in dx_after:
                     run_query(
                         """
                         INSERT INTO diagnoses (visit_id, icd_code, icd_name, is_primary)
                         VALUES (?, ?, ?, ?)
                         """,
-                        (selected_visit.id, code, name, 1 if i == dx_primary_idx else 0),
+                        (selected_visit.id, *encrypt_values((code, name)), 1 if primary else 0),
                     )
 
+                changes = diff(
+                    {
+                        "interview": visit_details["interview"],
+                        "examination": visit_details["examination"],
+                        "medications": visit_details["medications"],
+                        "recommendations": visit_details["recommendations"],
+                        "diagnoses": diagnoses_text(
+                            diagnoses[["icd_code", "icd_name", "is_primary"]].itertuples(index=False)
+                        ),
+                    },
+                    {
+                        "interview": interview_edit,
+                        "examination": exam_edit,
+                        "medications": meds_edit,
+                        "recommendations": rec_edit,
+                        "diagnoses": diagnoses_text(dx_after),
+                    },
+                )
+                if changes:
+                    log_event(
+                        current_user, "update", "visit", selected_visit.id, visit_details["patient_id"], changes
+                    )
                 st.success("Wizyta zaktualizowana.")
 
 # ------------------------
@@ -532,15 +674,8 @@ elif menu == "Kalendarz wizyt":
             (selected_visit.id,),
         ).iloc[0]
 
-        diagnoses = fetch_all(
-            """
-            SELECT icd_code, icd_name, is_primary
-            FROM diagnoses
-            WHERE visit_id = ?
-            ORDER BY is_primary DESC, icd_code
-            """,
-            (selected_visit.id,),
-        )
+        diagnoses = fetch_visit_diagnoses(selected_visit.id)
+        audit_view("visit", selected_visit.id, visit_details["patient_id"])
 
         st.subheader("Szczegóły wizyty")
         st.markdown(f"**Pacjent:** {visit_details['first_name']} {visit_details['last_name']} ({visit_details['pesel']})")
@@ -580,41 +715,231 @@ elif menu == "Kalendarz wizyt":
 elif menu == "Szablony tekstów":
     st.title("Szablony wywiadu / badania / zaleceń")
 
+    type_names = {
+        "interview": "Wywiad",
+        "examination": "Badanie",
+        "recommendations": "Zalecenia",
+    }
+    type_map = {label: t_type for t_type, label in type_names.items()}
+
     st.subheader("Dodaj nowy szablon")
+    st.caption("Dostępne zmienne: {imie}, {nazwisko}, {pacjent}, {pesel}, {data}.")
     with st.form("new_template_form"):
-        t_type_label = st.selectbox("Rodzaj", ["Wywiad", "Badanie", "Zalecenia"])
+        t_type_label = st.selectbox("Rodzaj", list(type_map))
         t_name = st.text_input("Nazwa szablonu")
         t_content = st.text_area("Treść szablonu", height=200)
         submitted_tpl = st.form_submit_button("Zapisz szablon")
 
         if submitted_tpl:
-            type_map = {
-                "Wywiad": "interview",
-                "Badanie": "examination",
-                "Zalecenia": "recommendations",
-            }
-            t_type = type_map[t_type_label]
-            run_query(
-                "INSERT INTO templates (type, name, content) VALUES (?, ?, ?)",
-                (t_type, t_name, t_content),
-            )
-            st.success("Szablon zapisany.")
+            if not t_name.strip():
+                st.error("Brak nazwy szablonu.")
+            else:
+                try:
+                    add_template(type_map[t_type_label], t_name.strip(), t_content)
+                    st.success("Szablon zapisany.")
+                except ValueError as e:
+                    st.error(str(e))
 
     st.subheader("Istniejące szablony")
-    all_tpl = fetch_all("SELECT id, type, name, content FROM templates ORDER BY type, name")
-    if all_tpl.empty:
+    if not all_templates():
         st.info("Brak szablonów.")
     else:
-        type_names = {
-            "interview": "Wywiad",
-            "examination": "Badanie",
-            "recommendations": "Zalecenia",
-        }
-        for t_type in ["interview", "examination", "recommendations"]:
-            subset = all_tpl[all_tpl["type"] == t_type]
-            if subset.empty:
+        for t_type in TEMPLATE_TYPES:
+            names = template_names(t_type)
+            if not names:
                 continue
             st.markdown(f"### {type_names.get(t_type, t_type)}")
-            for _, row in subset.iterrows():
-                with st.expander(row["name"]):
-                    st.write(row["content"])
+            for name in names:
+                tpl = get_template(t_type, name)
+                with st.expander(name):
+                    with st.form(f"edit_template_form_{tpl['id']}"):
+                        e_type_label = st.selectbox(
+                            "Rodzaj",
+                            list(type_map),
+                            index=list(type_map).index(type_names[t_type]),
+                        )
+                        e_name = st.text_input("Nazwa szablonu", value=tpl["name"])
+                        e_content = st.text_area("Treść szablonu", value=tpl["content"], height=200)
+                        c1, c2 = st.columns(2)
+                        with c1:
+                            save_tpl = st.form_submit_button("Zapisz zmiany")
+                        with c2:
+                            delete_tpl = st.form_submit_button("Usuń szablon")
+
+                        if save_tpl:
+                            if not e_name.strip():
+                                st.error("Brak nazwy szablonu.")
+                            else:
+                                try:
+                                    update_template(tpl["id"], type_map[e_type_label], e_name.strip(), e_content)
+                                    st.success("Szablon zaktualizowany.")
+                                except ValueError as e:
+                                    st.error(str(e))
+                        if delete_tpl:
+                            delete_template(tpl["id"])
+                            st.success("Szablon usunięty.")
+
+    duplicates = duplicate_templates()
+    if duplicates:
+        st.subheader("Zduplikowane szablony")
+        st.warning(
+            "Poniższe starsze szablony mają tę samą nazwę i rodzaj co nowszy szablon "
+            "i nie są dostępne przy wizycie. Usuń je lub zmień nazwę nowszego szablonu."
+        )
+        for tpl in duplicates:
+            with st.expander(f"{type_names.get(tpl['type'], tpl['type'])} – {tpl['name']} [ID {tpl['id']}]"):
+                st.write(tpl["content"])
+                if st.button("Usuń kopię", key=f"delete_duplicate_tpl_{tpl['id']}"):
+                    delete_template(tpl["id"])
+                    st.success("Szablon usunięty.")
+
+# ------------------------
+# HISTORIA PACJENTA (DZIENNIK AUDYTU)
+# ------------------------
+elif menu == "Historia pacjenta":
+    st.title("Historia dostępu i zmian – pacjent")
+
+    patients = fetch_all("SELECT id, first_name, last_name, pesel FROM patients ORDER BY last_name, first_name")
+    if patients.empty:
+        st.info("Brak pacjentów.")
+    else:
+        selected = st.selectbox(
+            "Pacjent",
+            patients.itertuples(),
+            format_func=lambda p: f"{p.last_name} {p.first_name} ({p.pesel})",
+        )
+        history, complete = patient_history(selected.id)
+        if not complete:
+            st.warning("Nie wszystkie wpisy dziennika zostały jeszcze zapisane – historia może być niepełna.")
+        if history.empty:
+            st.info("Brak wpisów w dzienniku.")
+        else:
+            st.dataframe(history.drop(columns=["changes"]), use_container_width=True)
+            for row in history.itertuples():
+                if not row.changes:
+                    continue
+                with st.expander(f"{row.ts} – {row.actor} – {row.action} {row.entity} [ID {row.entity_id}]"):
+                    if row.changes == UNREADABLE:
+                        st.text(UNREADABLE)
+                        continue
+                    for field, change in row.changes.items():
+                        st.markdown(f"**{field}**")
+                        c1, c2 = st.columns(2)
+                        c1.text(change["before"] or "-")
+                        c2.text(change["after"] or "-")
+
+# ------------------------
+# IMPORT / EKSPORT
+# ------------------------
+elif menu == "Import / eksport":
+    st.title("Import i eksport danych")
+
+    st.subheader("Import z pliku CSV / XLSX")
+    import_kind = st.radio("Rodzaj danych", ["Pacjenci", "Wizyty"], horizontal=True, key="import_kind")
+    fields = PATIENT_FIELDS if import_kind == "Pacjenci" else VISIT_FIELDS
+    st.caption("Oczekiwane kolumny: " + ", ".join(fields) + ". Wizyty wskazują pacjenta numerem PESEL.")
+    uploaded = st.file_uploader("Plik", type=["csv", "xlsx"])
+    encoding_label = st.selectbox("Kodowanie pliku CSV", ["Wykryj automatycznie", *ENCODINGS])
+
+    if uploaded is not None and st.button("Importuj"):
+        progress_bar = st.progress(0.0)
+        status = st.empty()
+        total = max(uploaded.size, 1)
+
+        def on_progress(report):
+            progress_bar.progress(min(uploaded.tell() / total, 1.0))
+            status.text(
+                f"Przetworzono: {report['processed']}, dodano: {report['inserted']}, "
+                f"duplikaty: {report['duplicates']}, błędne: {report['invalid']}"
+            )
+
+        importer = import_patients if import_kind == "Pacjenci" else import_visits
+        try:
+            report = importer(
+                read_rows(uploaded, uploaded.name, ENCODINGS.get(encoding_label)),
+                progress=on_progress,
+            )
+        except DataImportError as e:
+            st.error(str(e))
+            report = e.report
+        except RuntimeError as e:
+            st.error(str(e))
+            report = None
+        else:
+            progress_bar.progress(1.0)
+            on_progress(report)
+            st.success(f"Import zakończony. Dodano rekordów: {report['inserted']}.")
+
+        if report is not None:
+            if report["inserted"]:
+                log_event(
+                    current_user,
+                    "import",
+                    "patient" if import_kind == "Pacjenci" else "visit",
+                    None,
+                    None,
+                    diff(
+                        {},
+                        {
+                            "file": uploaded.name,
+                            "inserted": report["inserted"],
+                            "duplicates": report["duplicates"],
+                            "invalid": report["invalid"],
+                        },
+                    ),
+                )
+            if report["errors"]:
+                st.warning(f"Odrzucone wiersze: {report['invalid']}")
+                st.dataframe(
+                    pd.DataFrame(report["errors"], columns=["wiersz", "powód"]),
+                    use_container_width=True,
+                )
+
+    st.subheader("Eksport")
+    c1, c2 = st.columns(2)
+    with c1:
+        export_label = st.selectbox("Dane", ["Pacjenci", "Wizyty"])
+    with c2:
+        export_format = st.selectbox("Format", ["CSV", "Parquet"])
+
+    table = "patients" if export_label == "Pacjenci" else "visits"
+    n_rows = export_row_count(table)
+    if n_rows > UI_EXPORT_MAX_ROWS:
+        st.info(
+            f"Tabela ma {n_rows} wierszy – więcej niż {UI_EXPORT_MAX_ROWS} eksportowanych z przeglądarki. "
+            "Użyj polecenia:"
+        )
+        st.code(
+            f"gabinet-streamlit export {table} --format {export_format.lower()} "
+            f"--user \"{current_user}\" {table}.{'csv' if export_format == 'CSV' else 'parquet'}",
+            language="bash",
+        )
+    elif st.button("Przygotuj plik"):
+        suffix = ".csv" if export_format == "CSV" else ".parquet"
+        fd, export_path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            if export_format == "CSV":
+                with open(export_path, "w", encoding="utf-8", newline="") as f:
+                    count = export_csv(table, f)
+            else:
+                count = export_parquet(table, export_path)
+            log_event(
+                current_user,
+                "export",
+                "patient" if table == "patients" else "visit",
+                None,
+                None,
+                diff({}, {"format": export_format, "rows": count}),
+            )
+            with open(export_path, "rb") as f:
+                st.download_button(
+                    f"Pobierz plik (wierszy: {count})",
+                    data=f,
+                    file_name=f"{table}{suffix}",
+                    mime="text/csv" if export_format == "CSV" else "application/octet-stream",
+                )
+        except RuntimeError as e:
+            st.error(str(e))
+        finally:
+            os.remove(export_path)
@@ -0,0 +1,205 @@
+"""Dziennik audytu: kto wyświetlił lub zmienił dane pacjenta / wizyty.
+
+Wpisy trafiają do kolejki w pamięci, a osobny wątek zapisuje je paczkami
+w jednej transakcji – rejestrowanie zdarzeń nie dodaje zapisu do bazy
+w trakcie przebiegu strony. Tabela ``audit_log`` jest tylko do dopisywania
+(wyzwalacze w ``init_db`` blokują UPDATE i DELETE). Wpis odrzucony przez bazę
+(np. brak użytkownika) trafia z opisem błędu do ``audit_dead_letter``, żeby nie
+blokował zapisu kolejnych.
+"""
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from db import DB_PATH, fetch_all
+from db_crypto import UNREADABLE, decrypt, encrypt
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 2.0
+
+FLUSH_TIMEOUT = 10.0
+
+# błędy samego wpisu – ponowienie nic nie da; pozostałe (np. zablokowana baza) są przejściowe
+_REJECTED_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, TypeError, ValueError)
+
+_queue = queue.Queue()
+# ustawiane, gdy ostatni zapis się nie udał – flush() nie czeka wtedy pełnego czasu
+_failing = threading.Event()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _clean(value):
+    # NaN z DataFrame traktujemy jak brak wartości
+    if value is None or value != value:
+        return None
+    return value
+
+
+def diff(before, after):
+    """Zmienione pola jako {pole: {"before": ..., "after": ...}}."""
+    changes = {}
+    for key in after:
+        old, new = _clean(before.get(key)), _clean(after.get(key))
+        if (old or None) != (new or None):
+            changes[key] = {"before": old, "after": new}
+    return changes
+
+
+def log_event(actor, action, entity, entity_id, patient_id, changes=None):
+    _ensure_writer()
+    _queue.put(
+        (
+            datetime.now().isoformat(),
+            actor,
+            action,
+            entity,
+            int(entity_id) if entity_id is not None else None,
+            int(patient_id) if patient_id is not None else None,
+            changes,
+        )
+    )
+
+
+def _encrypt_json(value):
+    return encrypt(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def _write_batch(batch):
+    rows = [(*event[:6], _encrypt_json(event[6]) if event[6] else None) for event in batch]
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO audit_log (ts, actor, action, entity, entity_id, patient_id, changes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+    finally:
+        conn.close()
+
+
+def _collect():
+    """Zbiera wpisy przez FLUSH_INTERVAL od pierwszego (albo do BATCH_SIZE lub żądania flush)."""
+    batch, markers = [], []
+    item = _queue.get()
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while True:
+        # threading.Event w kolejce to żądanie flush(): wszystko przed nim jest już w paczce
+        if isinstance(item, threading.Event):
+            markers.append(item)
+        else:
+            batch.append(item)
+        remaining = deadline - time.monotonic()
+        if markers or len(batch) >= BATCH_SIZE or remaining <= 0:
+            return batch, markers
+        try:
+            item = _queue.get(timeout=remaining)
+        except queue.Empty:
+            return batch, markers
+
+
+def _dead_letter(event, error):
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO audit_dead_letter (ts, event, error) VALUES (?, ?, ?)",
+                (datetime.now().isoformat(), _encrypt_json(list(event)), f"{type(error).__name__}: {error}"),
+            )
+    finally:
+        conn.close()
+
+
+def _write_each(batch):
+    """Zapisuje wpisy pojedynczo; zwraca wpisy do ponowienia po błędzie przejściowym."""
+    for i, event in enumerate(batch):
+        try:
+            try:
+                _write_batch([event])
+            except _REJECTED_ERRORS as e:
+                _dead_letter(event, e)
+        except Exception:
+            return batch[i:]
+    return []
+
+
+def _run():
+    while True:
+        batch, markers = _collect()
+        try:
+            if batch:
+                _write_batch(batch)
+            pending = []
+        except Exception:
+            # jeden błędny wpis nie może zatrzymać całej paczki
+            pending = _write_each(batch)
+        if pending:
+            # wpisy i żądania flush wracają do kolejki i czekają na kolejną próbę
+            _failing.set()
+            for item in pending + markers:
+                _queue.put(item)
+            time.sleep(FLUSH_INTERVAL)
+        else:
+            _failing.clear()
+            for marker in markers:
+                marker.set()
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """Czeka, aż wątek zapisze wpisy dodane przed wywołaniem; zwraca False po przekroczeniu czasu."""
+    _ensure_writer()
+    marker = threading.Event()
+    _queue.put(marker)
+    if _failing.is_set():
+        timeout = min(timeout, FLUSH_INTERVAL)
+    if marker.wait(timeout):
+        return True
+    _failing.set()
+    return False
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name="gabinet-audit", daemon=True)
+            _writer.start()
+
+
+atexit.register(flush)
+
+
+def _decrypt_changes(value):
+    if not isinstance(value, str):
+        return None
+    plain = decrypt(value)
+    return UNREADABLE if plain == UNREADABLE else json.loads(plain)
+
+
+def patient_history(patient_id):
+    """Zwraca (historia, kompletna); ``kompletna`` jest False, gdy nie wszystkie wpisy zapisano."""
+    complete = flush()
+    history = fetch_all(
+        """
+        SELECT id, ts, actor, action, entity, entity_id, changes
+        FROM audit_log
+        WHERE patient_id = ?
+        ORDER BY ts DESC, id DESC
+        """,
+        (int(patient_id),),
+    )
+    # dtype=object – przy samych tekstach i None pandas wybrałby typ str, w którym None staje się NaN
+    history["changes"] = pd.Series(
+        [_decrypt_changes(v) for v in history["changes"]], index=history.index, dtype=object
+    )
+    return history, complete
@@ -0,0 +1,111 @@
+"""Benchmark narzutu szyfrowania kolumn na odczyt i zapis.
+
+Uruchomienie: ``python bench_crypto.py [liczba_operacji]``.
+
+Mierzony jest sam koszt kryptografii na jeden wiersz (szyfrowanie pól pacjenta
+i wizyty wraz z indeksem ślepym przy zapisie, odszyfrowanie pól przy odczycie).
+Czas połączenia z bazą i zapisu na dysk jest taki sam z szyfrowaniem i bez niego,
+więc nie wchodzi do porównania. Pomiar powtarzany jest ``TRIALS`` razy, a z p99
+poszczególnych prób brana jest mediana.
+
+Kończy się kodem 1, gdy narzut przekracza budżet ``BUDGET_MS``.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GABINET_DB_KEY", "benchmark-only-passphrase")
+
+import db  # noqa: E402
+import db_crypto  # noqa: E402
+
+# Maksymalny dopuszczalny narzut szyfrowania na jedną operację (p99)
+BUDGET_MS = 1.0
+TRIALS = 5
+
+NOTE = "Pacjent zgłasza ból głowy od 3 dni, bez gorączki. " * 20
+PATIENT = ("90010100000", "ul. Testowa 1, Warszawa", "600100200", "pacjent@example.com")
+VISIT = (NOTE, NOTE, "Paracetamol – 500 mg – 3x1", NOTE)
+
+
+def _p99(samples):
+    return statistics.quantiles(samples, n=100)[98]
+
+
+def _write_row():
+    db.encrypt_values(PATIENT)
+    db_crypto.blind_index(PATIENT[0])
+    db.encrypt_values(VISIT)
+
+
+def _sample(fn, args, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def run(n):
+    """Zwraca True, gdy narzut mieści się w budżecie."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+
+        # init_db() wyprowadził już klucz – bez czyszczenia pamięci podręcznej pomiar dałby 0 ms
+        db_crypto._keys.cache_clear()
+        start = time.perf_counter()
+        db_crypto.check_key()
+        kdf_ms = (time.perf_counter() - start) * 1000
+
+        # wiersz odczytu: PESEL pacjenta i cztery pola tekstowe wizyty
+        stored = db.encrypt_values(PATIENT[:1] + VISIT)
+        write_p99, read_p99 = [], []
+        for _ in range(TRIALS):
+            write_p99.append(_p99(_sample(_write_row, (), n)))
+            read_p99.append(_p99(_sample(lambda: [db_crypto.decrypt(v) for v in stored], (), n)))
+
+        for i in range(n):
+            pesel = f"{90010100000 + i:011d}"
+            db.run_query(
+                "INSERT INTO patients (first_name, last_name, pesel, pesel_bidx) VALUES ('Jan', 'Kowalski', ?, ?)",
+                (db_crypto.encrypt(pesel), db_crypto.blind_index(pesel)),
+            )
+        target = f"{90010100000 + n // 2:011d}"
+        start = time.perf_counter()
+        db.fetch_all("SELECT id FROM patients WHERE pesel_bidx = ?", (db_crypto.blind_index(target),))
+        lookup_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        [row for row in db.fetch_all("SELECT id, pesel FROM patients").itertuples() if row.pesel == target]
+        scan_ms = (time.perf_counter() - start) * 1000
+
+    write_ms, read_ms = statistics.median(write_p99), statistics.median(read_p99)
+    print(f"Operacji: {n} x {TRIALS} prób, budżet narzutu p99: {BUDGET_MS:.2f} ms")
+    print(f"Wyprowadzenie klucza (raz na proces): {kdf_ms:.1f} ms")
+    print(f"write: narzut p99 {write_ms:.3f} ms (próby: {', '.join(f'{v:.3f}' for v in write_p99)})")
+    print(f"read : narzut p99 {read_ms:.3f} ms (próby: {', '.join(f'{v:.3f}' for v in read_p99)})")
+    print(f"Wyszukiwanie PESEL: indeks ślepy {lookup_ms:.3f} ms, odszyfrowanie i skan {scan_ms:.3f} ms")
+    return write_ms <= BUDGET_MS and read_ms <= BUDGET_MS
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        n = int(argv[0]) if argv else 500
+    except ValueError:
+        n = 0
+    if n < 2:
+        print("Liczba operacji musi być liczbą całkowitą nie mniejszą niż 2.")
+        return 2
+    if not run(n):
+        print("Narzut szyfrowania przekracza budżet.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,24 @@
 import sqlite3
 import pandas as pd
 
+from db_crypto import blind_index, check_key, decrypt, encrypt, normalize_pesel
+
 DB_PATH = "clinic.db"
 
+# Kolumny przechowywane w bazie w postaci zaszyfrowanej
+PATIENT_ENCRYPTED_COLUMNS = ["pesel", "address", "phone", "email"]
+VISIT_ENCRYPTED_COLUMNS = ["interview", "examination", "medications", "recommendations"]
+DIAGNOSIS_ENCRYPTED_COLUMNS = ["icd_code", "icd_name"]
+ENCRYPTED_COLUMNS = set(PATIENT_ENCRYPTED_COLUMNS + VISIT_ENCRYPTED_COLUMNS + DIAGNOSIS_ENCRYPTED_COLUMNS)
+
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
 
+    # WAL pozwala wykonywać kopie zapasowe online bez blokowania zapisów
+    c.execute("PRAGMA journal_mode=WAL")
+
     c.execute("""
         CREATE TABLE IF NOT EXISTS patients (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,7 +28,8 @@ def init_db():
             address TEXT,
             phone TEXT,
             email TEXT,
-            created_at TEXT
+            created_at TEXT,
+            pesel_bidx TEXT
         )
     """)
 
@@ -62,30 +74,140 @@ def init_db():
         )
     """)
 
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            actor TEXT NOT NULL,
+            action TEXT NOT NULL,   -- 'view', 'create', 'update'
+            entity TEXT NOT NULL,   -- 'patient', 'visit'
+            entity_id INTEGER,
+            patient_id INTEGER,
+            changes TEXT            -- zaszyfrowany JSON {pole: {before, after}}
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_patient ON audit_log(patient_id, ts)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS audit_dead_letter (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            event TEXT NOT NULL,    -- zaszyfrowany JSON odrzuconego wpisu
+            error TEXT NOT NULL
+        )
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_no_update BEFORE UPDATE ON audit_log
+        BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_log_no_delete BEFORE DELETE ON audit_log
+        BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+    patient_columns = [row[1] for row in c.execute("PRAGMA table_info(patients)")]
+    if "pesel_bidx" not in patient_columns:
+        c.execute("ALTER TABLE patients ADD COLUMN pesel_bidx TEXT")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_pesel_bidx ON patients(pesel_bidx)")
+    conn.commit()
+
+    # przy każdym starcie: klucz musi być tym, którym zaszyfrowano dane (CryptoError)
+    check_key()
+
+    if c.execute("SELECT 1 FROM meta WHERE key = 'encryption'").fetchone() is None:
+        _encrypt_legacy_rows(c)
+        c.execute("INSERT INTO meta (key, value) VALUES ('encryption', 'aes-256-gcm')")
+
     conn.commit()
     conn.close()
 
 
+def _encrypt_legacy_rows(c):
+    """Jednorazowo szyfruje wiersze zapisane przed włączeniem szyfrowania."""
+    rows = c.execute("SELECT id, pesel, address, phone, email FROM patients ORDER BY id").fetchall()
+    seen = set()
+    for row_id, pesel, address, phone, email in rows:
+        pesel = normalize_pesel(pesel)
+        # PESEL różniący się tylko spacjami od wcześniejszego pacjenta: bez indeksu,
+        # do ręcznego scalenia (zob. duplicate_pesel_patients)
+        bidx = blind_index(pesel)
+        if bidx in seen:
+            bidx = None
+        else:
+            seen.add(bidx)
+        c.execute(
+            "UPDATE patients SET pesel = ?, address = ?, phone = ?, email = ?, pesel_bidx = ? WHERE id = ?",
+            (*encrypt_values((pesel, address, phone, email)), bidx, row_id),
+        )
+
+    rows = c.execute("SELECT id, interview, examination, medications, recommendations FROM visits").fetchall()
+    for row_id, *texts in rows:
+        c.execute(
+            "UPDATE visits SET interview = ?, examination = ?, medications = ?, recommendations = ? WHERE id = ?",
+            (*encrypt_values(texts), row_id),
+        )
+
+    rows = c.execute("SELECT id, icd_code, icd_name FROM diagnoses").fetchall()
+    for row_id, code, name in rows:
+        c.execute(
+            "UPDATE diagnoses SET icd_code = ?, icd_name = ? WHERE id = ?",
+            (*encrypt_values((code, name)), row_id),
+        )
+
+
+def duplicate_pesel_patients():
+    """Pacjenci pominięci w migracji, bo ich PESEL powtarza się u innego pacjenta."""
+    return fetch_all(
+        "SELECT id, first_name, last_name, created_at FROM patients WHERE pesel_bidx IS NULL ORDER BY id"
+    )
+
+
+def encrypt_values(values):
+    return tuple(encrypt(v) for v in values)
+
+
 def run_query(query, params=()):
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(query, params)
-    conn.commit()
-    conn.close()
+    try:
+        c = conn.cursor()
+        c.execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
 
 
 def insert_and_get_id(query, params=()):
+    # zamknięcie połączenia po błędzie (np. IntegrityError) zwalnia blokadę zapisu
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(query, params)
-    conn.commit()
-    last_id = c.lastrowid
-    conn.close()
-    return last_id
+    try:
+        c = conn.cursor()
+        c.execute(query, params)
+        conn.commit()
+        return c.lastrowid
+    finally:
+        conn.close()
 
 
 def fetch_all(query, params=()):
     conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
+    try:
+        c = conn.cursor()
+        c.execute(query, params)
+        columns = [d[0] for d in c.description]
+        rows = c.fetchall()
+    finally:
+        conn.close()
+
+    encrypted = [i for i, col in enumerate(columns) if col in ENCRYPTED_COLUMNS]
+    if encrypted:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for i in encrypted:
+                row[i] = decrypt(row[i])
+    return pd.DataFrame.from_records(rows, columns=columns)
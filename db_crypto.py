@@ -0,0 +1,150 @@
+"""Szyfrowanie kolumn z danymi wrażliwymi (AES-256-GCM) i indeks ślepy dla PESEL.
+
+Hasło bazy pochodzi ze zmiennej środowiskowej ``GABINET_DB_KEY``. Gdy jej brak,
+przy pierwszym uruchomieniu generowany jest plik klucza obok bazy (``clinic.key``),
+który należy przechowywać poza kopiami zapasowymi bazy.
+
+Wyprowadzenie klucza (scrypt) odbywa się raz na proces, a jego wynik jest
+przechowywany w pamięci – kolejne połączenia z bazą nie ponoszą tego kosztu.
+"""
+
+import base64
+import functools
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+PREFIX = "enc1:"
+KEY_ENV = "GABINET_DB_KEY"
+KEY_CHECK_LABEL = b"gabinet-key-check-v1"
+
+# Wyświetlane zamiast wartości, której nie udało się odszyfrować
+UNREADABLE = "[nie można odszyfrować]"
+
+_NONCE_SIZE = 12
+_SCRYPT_PARAMS = {"n": 2**15, "r": 8, "p": 1, "maxmem": 64 * 1024 * 1024}
+
+
+class CryptoError(RuntimeError):
+    """Niewłaściwy klucz bazy lub dane, których nie da się odszyfrować."""
+
+
+def _db_path():
+    from db import DB_PATH
+
+    return DB_PATH
+
+
+def _passphrase(db_path):
+    value = os.environ.get(KEY_ENV)
+    if value:
+        return value.encode("utf-8")
+
+    key_file = os.path.splitext(db_path)[0] + ".key"
+    if not os.path.exists(key_file):
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(secrets.token_urlsafe(32))
+    with open(key_file, encoding="utf-8") as f:
+        return f.read().strip().encode("utf-8")
+
+
+def _salt(db_path):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    c.execute(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('crypto_salt', ?)",
+        (secrets.token_hex(16),),
+    )
+    conn.commit()
+    c.execute("SELECT value FROM meta WHERE key = 'crypto_salt'")
+    salt = bytes.fromhex(c.fetchone()[0])
+    conn.close()
+    return salt
+
+
+def _key_source(db_path):
+    if os.environ.get(KEY_ENV):
+        return f"zmienna {KEY_ENV}"
+    return f"plik {os.path.splitext(db_path)[0]}.key"
+
+
+def _verify_key(db_path, mac_key):
+    """Porównuje klucz z wartością kontrolną zapisaną w ``meta`` przy pierwszym użyciu."""
+    check = hmac.new(mac_key, KEY_CHECK_LABEL, hashlib.sha256).hexdigest()
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('key_check', ?)", (check,))
+        conn.commit()
+        row = c.execute("SELECT value FROM meta WHERE key = 'key_check'").fetchone()
+    finally:
+        conn.close()
+
+    if not hmac.compare_digest(row[0], check):
+        raise CryptoError(
+            f"Klucz szyfrowania ({_key_source(db_path)}) nie pasuje do bazy {db_path}. "
+            f"Ustaw klucz, którym baza została zaszyfrowana – przy przejściu z pliku klucza "
+            f"na {KEY_ENV} wpisz do zmiennej zawartość tego pliku."
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _keys(db_path):
+    material = hashlib.scrypt(_passphrase(db_path), salt=_salt(db_path), dklen=64, **_SCRYPT_PARAMS)
+    aead, mac_key = AESGCM(material[:32]), material[32:]
+    _verify_key(db_path, mac_key)
+    return aead, mac_key
+
+
+def check_key():
+    """Wyprowadza klucz (raz na proces) i sprawdza, czy pasuje do bazy; zgłasza ``CryptoError``."""
+    _keys(_db_path())
+
+
+def _decrypt_with(aead, value):
+    try:
+        token = base64.urlsafe_b64decode(value[len(PREFIX):])
+        return aead.decrypt(token[:_NONCE_SIZE], token[_NONCE_SIZE:], None).decode("utf-8")
+    except (InvalidTag, ValueError):
+        return None
+
+
+def encrypt(value):
+    """Szyfruje tekst; ``None`` i pusty tekst zwraca bez zmian."""
+    if value is None or value == "":
+        return value
+    if value == UNREADABLE:
+        raise CryptoError("Nie można zapisać wartości, której nie udało się odszyfrować.")
+    aead, _ = _keys(_db_path())
+    nonce = os.urandom(_NONCE_SIZE)
+    token = nonce + aead.encrypt(nonce, str(value).encode("utf-8"), None)
+    return PREFIX + base64.urlsafe_b64encode(token).decode("ascii")
+
+
+def decrypt(value):
+    """Odszyfrowuje wartość; tekst niezaszyfrowany zwraca bez zmian.
+
+    Uszkodzona wartość daje ``UNREADABLE`` zamiast wyjątku, żeby strona się wyświetliła.
+    """
+    if not isinstance(value, str) or not value.startswith(PREFIX):
+        return value
+    aead, _ = _keys(_db_path())
+    plain = _decrypt_with(aead, value)
+    return UNREADABLE if plain is None else plain
+
+
+def normalize_pesel(pesel):
+    return "".join(str(pesel).split())
+
+
+def blind_index(pesel):
+    """Deterministyczny skrót HMAC numeru PESEL – pozwala wyszukiwać bez odszyfrowania."""
+    _, mac_key = _keys(_db_path())
+    return hmac.new(mac_key, normalize_pesel(pesel).encode("utf-8"), hashlib.sha256).hexdigest()
@@ -0,0 +1,238 @@
+"""Online backups of the clinic database.
+
+Snapshots are taken with SQLite's online backup API in small page steps, so
+the running app keeps reading and writing while a backup is in progress.
+Each snapshot is gzip-compressed and accompanied by a ``.sha256`` file.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_DB_PATH = "clinic.db"
+DEFAULT_DEST = os.environ.get("GABINET_BACKUP_DIR", "backups")
+DEFAULT_KEEP = int(os.environ.get("GABINET_BACKUP_KEEP", "14"))
+DEFAULT_INTERVAL_HOURS = float(os.environ.get("GABINET_BACKUP_INTERVAL_HOURS", "24"))
+
+# Pages copied per backup step and the share of wall time the backup may use.
+PAGES_PER_STEP = 64
+MAX_DUTY_CYCLE = 0.2
+MIN_STEP_SLEEP = 0.005
+
+SNAPSHOT_SUFFIX = ".db.gz"
+CHECKSUM_SUFFIX = ".sha256"
+
+
+class BackupError(Exception):
+    """Raised when a snapshot cannot be created, verified or restored."""
+
+
+def _throttle(duty_cycle: float):
+    """Progress callback that sleeps after each step to cap the backup's duty cycle."""
+    last = time.perf_counter()
+    ratio = (1 - duty_cycle) / duty_cycle
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal last
+        step = time.perf_counter() - last
+        if remaining:
+            time.sleep(max(MIN_STEP_SLEEP, step * ratio))
+        last = time.perf_counter()
+
+    return progress
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _check_integrity(db_file: Path) -> None:
+    conn = sqlite3.connect(db_file)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise BackupError(f"Integrity check failed for {db_file}: {result}")
+
+
+def list_snapshots(dest: str | os.PathLike = DEFAULT_DEST) -> list[Path]:
+    """Snapshots in ``dest``, oldest first."""
+    dest = Path(dest)
+    if not dest.is_dir():
+        return []
+    return sorted(dest.glob(f"*{SNAPSHOT_SUFFIX}"))
+
+
+def prune_snapshots(dest: str | os.PathLike = DEFAULT_DEST, keep: int = DEFAULT_KEEP) -> list[Path]:
+    removed = list_snapshots(dest)[:-keep] if keep > 0 else []
+    for snapshot in removed:
+        snapshot.unlink()
+        Path(str(snapshot) + CHECKSUM_SUFFIX).unlink(missing_ok=True)
+    return removed
+
+
+def create_snapshot(
+    db_path: str | os.PathLike = DEFAULT_DB_PATH,
+    dest: str | os.PathLike = DEFAULT_DEST,
+    keep: int = DEFAULT_KEEP,
+    pages: int = PAGES_PER_STEP,
+    duty_cycle: float = MAX_DUTY_CYCLE,
+) -> Path:
+    """Copy ``db_path`` online into a compressed, checksummed snapshot in ``dest``."""
+    db_path = Path(db_path)
+    if not db_path.exists():
+        raise BackupError(f"Database not found: {db_path}")
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    snapshot = dest / f"{db_path.stem}-{stamp}{SNAPSHOT_SUFFIX}"
+
+    with tempfile.TemporaryDirectory(dir=dest) as tmp:
+        copy = Path(tmp) / db_path.name
+        source = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True, isolation_level=None)
+        target = sqlite3.connect(copy)
+        try:
+            # In WAL mode an open read transaction pins a point-in-time view:
+            # concurrent writers are not blocked and do not restart the copy.
+            if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=pages, progress=_throttle(duty_cycle))
+        finally:
+            target.close()
+            source.close()
+        _check_integrity(copy)
+
+        partial = Path(tmp) / snapshot.name
+        with open(copy, "rb") as src, gzip.open(partial, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        checksum = _sha256(partial)
+        os.replace(partial, snapshot)
+
+    Path(str(snapshot) + CHECKSUM_SUFFIX).write_text(f"{checksum}  {snapshot.name}\n", encoding="utf-8")
+    prune_snapshots(dest, keep)
+    return snapshot
+
+
+def verify_snapshot(snapshot: str | os.PathLike) -> None:
+    """Check the snapshot against its ``.sha256`` file."""
+    snapshot = Path(snapshot)
+    checksum_file = Path(str(snapshot) + CHECKSUM_SUFFIX)
+    if not snapshot.exists():
+        raise BackupError(f"Snapshot not found: {snapshot}")
+    if not checksum_file.exists():
+        raise BackupError(f"Checksum file not found: {checksum_file}")
+    expected = checksum_file.read_text(encoding="utf-8").split()[0]
+    if _sha256(snapshot) != expected:
+        raise BackupError(f"Checksum mismatch for {snapshot}")
+
+
+def restore_snapshot(
+    snapshot: str | os.PathLike,
+    db_path: str | os.PathLike = DEFAULT_DB_PATH,
+    dest: str | os.PathLike = DEFAULT_DEST,
+) -> Path | None:
+    """Verify ``snapshot`` and restore it into ``db_path``.
+
+    The current database is snapshotted first; that safety snapshot's path is
+    returned (``None`` if there was no database to save).
+    """
+    snapshot = Path(snapshot)
+    db_path = Path(db_path)
+    verify_snapshot(snapshot)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        restored = Path(tmp) / db_path.name
+        with gzip.open(snapshot, "rb") as src, open(restored, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        _check_integrity(restored)
+
+        safety = create_snapshot(db_path, dest, keep=0) if db_path.exists() else None
+
+        source = sqlite3.connect(restored)
+        target = sqlite3.connect(db_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    return safety
+
+
+class BackupScheduler(threading.Thread):
+    """Daemon thread taking a snapshot whenever the newest one is older than ``interval_hours``."""
+
+    def __init__(
+        self,
+        db_path: str | os.PathLike = DEFAULT_DB_PATH,
+        dest: str | os.PathLike = DEFAULT_DEST,
+        interval_hours: float = DEFAULT_INTERVAL_HOURS,
+        keep: int = DEFAULT_KEEP,
+    ) -> None:
+        super().__init__(name="gabinet-backup", daemon=True)
+        self.db_path = db_path
+        self.dest = dest
+        self.interval = interval_hours * 3600
+        self.keep = keep
+        self.last_error: Exception | None = None
+        self._stop_event = threading.Event()
+
+    def _seconds_until_due(self) -> float:
+        snapshots = list_snapshots(self.dest)
+        if not snapshots:
+            return 0
+        age = time.time() - snapshots[-1].stat().st_mtime
+        return max(0, self.interval - age)
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            wait = self._seconds_until_due()
+            if wait:
+                self._stop_event.wait(min(wait, 3600))
+                continue
+            try:
+                create_snapshot(self.db_path, self.dest, self.keep)
+                self.last_error = None
+            except (BackupError, OSError, sqlite3.Error) as e:
+                self.last_error = e
+                self._stop_event.wait(min(self.interval, 3600))
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+_scheduler: BackupScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(
+    db_path: str | os.PathLike = DEFAULT_DB_PATH,
+    dest: str | os.PathLike = DEFAULT_DEST,
+    interval_hours: float = DEFAULT_INTERVAL_HOURS,
+    keep: int = DEFAULT_KEEP,
+) -> BackupScheduler | None:
+    """Start the backup thread once per process; ``interval_hours <= 0`` disables it."""
+    global _scheduler
+    if interval_hours <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = BackupScheduler(db_path, dest, interval_hours, keep)
+            _scheduler.start()
+        return _scheduler
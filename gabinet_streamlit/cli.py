@@ -1,18 +1,129 @@
-"""CLI entry point for running the Streamlit app."""
+"""CLI entry point for running the Streamlit app and maintenance commands."""
 
 from __future__ import annotations
 
+import argparse
+import importlib
 import sys
 from pathlib import Path
 
-from streamlit.web import cli as stcli
+from gabinet_streamlit import backup
 
 
-def main() -> int:
-    app_path = Path(__file__).resolve().parents[1] / "app.py"
+APP_DIR = Path(__file__).resolve().parents[1]
+
+
+def run_app() -> int:
+    from streamlit.web import cli as stcli
+
+    app_path = APP_DIR / "app.py"
     sys.argv = ["streamlit", "run", str(app_path)]
     return stcli.main()
 
 
+def run_backup(args: argparse.Namespace) -> int:
+    if args.list:
+        for snapshot in backup.list_snapshots(args.dest):
+            print(snapshot)
+        return 0
+    snapshot = backup.create_snapshot(args.db, args.dest, keep=args.keep, pages=args.pages)
+    print(f"Snapshot saved: {snapshot}")
+    return 0
+
+
+def run_restore(args: argparse.Namespace) -> int:
+    safety = backup.restore_snapshot(args.snapshot, args.db, args.dest)
+    if safety is not None:
+        print(f"Previous database saved: {safety}")
+    print(f"Restored {args.db} from {args.snapshot}")
+    return 0
+
+
+def _app_modules(db_path: str):
+    # moduły aplikacji leżą obok app.py i czytają ścieżkę bazy z własnej kopii DB_PATH
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+    modules = [importlib.import_module(name) for name in ("db", "patient_io", "audit")]
+    for module in modules:
+        module.DB_PATH = db_path
+    return modules
+
+
+def run_export(args: argparse.Namespace) -> int:
+    if not Path(args.db).exists():
+        print(f"error: database not found: {args.db}", file=sys.stderr)
+        return 1
+    db, patient_io, audit = _app_modules(args.db)
+    try:
+        db.init_db()
+        if args.format == "csv":
+            with open(args.out, "w", encoding="utf-8", newline="") as f:
+                count = patient_io.export_csv(args.table, f)
+        else:
+            count = patient_io.export_parquet(args.table, args.out)
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    audit.log_event(
+        args.user,
+        "export",
+        "patient" if args.table == "patients" else "visit",
+        None,
+        None,
+        audit.diff({}, {"format": args.format, "rows": count, "file": str(args.out)}),
+    )
+    if not audit.flush():
+        print("error: export written but the audit entry could not be saved", file=sys.stderr)
+        return 1
+    print(f"Exported {count} rows to {args.out}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="gabinet-streamlit")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backup_parser = subparsers.add_parser("backup", help="take an online snapshot of the database")
+    backup_parser.add_argument("--db", default=backup.DEFAULT_DB_PATH, help="database file")
+    backup_parser.add_argument("--dest", default=backup.DEFAULT_DEST, help="snapshot directory")
+    backup_parser.add_argument(
+        "--keep", type=int, default=backup.DEFAULT_KEEP, help="snapshots to retain (0 keeps all)"
+    )
+    backup_parser.add_argument(
+        "--pages", type=int, default=backup.PAGES_PER_STEP, help="pages copied per backup step"
+    )
+    backup_parser.add_argument("--list", action="store_true", help="list existing snapshots and exit")
+    backup_parser.set_defaults(func=run_backup)
+
+    restore_parser = subparsers.add_parser("restore", help="verify a snapshot and restore it")
+    restore_parser.add_argument("snapshot", help="snapshot file (*.db.gz)")
+    restore_parser.add_argument("--db", default=backup.DEFAULT_DB_PATH, help="database file")
+    restore_parser.add_argument(
+        "--dest", default=backup.DEFAULT_DEST, help="directory for the pre-restore snapshot"
+    )
+    restore_parser.set_defaults(func=run_restore)
+
+    export_parser = subparsers.add_parser("export", help="stream a decrypted table to a file")
+    export_parser.add_argument("table", choices=["patients", "visits"])
+    export_parser.add_argument("out", help="output file")
+    export_parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    export_parser.add_argument("--user", required=True, help="name recorded in the audit log")
+    export_parser.add_argument("--db", default=backup.DEFAULT_DB_PATH, help="database file")
+    export_parser.set_defaults(func=run_export)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command is None:
+        return run_app()
+    try:
+        return args.func(args)
+    except backup.BackupError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
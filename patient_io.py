@@ -0,0 +1,436 @@
+"""Masowy import i eksport pacjentów oraz wizyt.
+
+Import czyta plik CSV/XLSX wiersz po wierszu, waliduje PESEL, odrzuca duplikaty
+(w pliku i w bazie, po indeksie ślepym) i zapisuje dane paczkami – jedna
+transakcja na paczkę. Eksport pobiera wiersze z bazy porcjami (``fetchmany``),
+więc cała tabela nigdy nie jest trzymana w pamięci.
+"""
+
+import codecs
+import csv
+import hashlib
+import io
+import sqlite3
+import zipfile
+from datetime import date, datetime
+
+from db import DB_PATH, PATIENT_ENCRYPTED_COLUMNS, VISIT_ENCRYPTED_COLUMNS, encrypt_values
+from db_crypto import blind_index, decrypt, normalize_pesel
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+PATIENT_FIELDS = ["first_name", "last_name", "pesel", "address", "phone", "email"]
+VISIT_FIELDS = ["pesel", "date", "interview", "examination", "medications", "recommendations"]
+
+# Nagłówki kolumn akceptowane w plikach importu
+COLUMN_ALIASES = {
+    "imie": "first_name",
+    "imię": "first_name",
+    "nazwisko": "last_name",
+    "adres": "address",
+    "telefon": "phone",
+    "e-mail": "email",
+    "data": "date",
+    "wywiad": "interview",
+    "badanie": "examination",
+    "leki": "medications",
+    "zalecenia": "recommendations",
+}
+
+EXPORT_QUERIES = {
+    "patients": (
+        "SELECT id, first_name, last_name, pesel, address, phone, email, created_at FROM patients ORDER BY id"
+    ),
+    "visits": (
+        "SELECT v.id, p.pesel, v.date, v.interview, v.examination, v.medications, v.recommendations "
+        "FROM visits v JOIN patients p ON p.id = v.patient_id ORDER BY v.id"
+    ),
+}
+
+# większe eksporty tylko przez CLI – przycisk pobierania trzyma cały plik w pamięci serwera
+UI_EXPORT_MAX_ROWS = 5000
+
+ENCODINGS = {"UTF-8": "utf-8-sig", "Windows-1250": "cp1250"}
+
+_PESEL_WEIGHTS = [1, 3, 7, 9, 1, 3, 7, 9, 1, 3]
+_PESEL_CENTURIES = {0: 1900, 20: 2000, 40: 2100, 60: 2200, 80: 1800}
+
+
+class DataImportError(RuntimeError):
+    """Błąd pliku lub zapisu podczas importu; ``report`` opisuje stan sprzed przerwania."""
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report
+
+
+def validate_pesel(pesel) -> bool:
+    """Sprawdza format, datę urodzenia i cyfrę kontrolną numeru PESEL."""
+    pesel = normalize_pesel(pesel or "")
+    if len(pesel) != 11 or not pesel.isdigit():
+        return False
+    digits = [int(d) for d in pesel]
+    if (10 - sum(w * d for w, d in zip(_PESEL_WEIGHTS, digits)) % 10) % 10 != digits[10]:
+        return False
+
+    month = digits[2] * 10 + digits[3]
+    offset = (month - 1) // 20 * 20
+    try:
+        date(_PESEL_CENTURIES[offset] + digits[0] * 10 + digits[1], month - offset, digits[4] * 10 + digits[5])
+    except (KeyError, ValueError):
+        return False
+    return True
+
+
+def _require(module, package):
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError as e:
+        raise RuntimeError(f"Ta operacja wymaga pakietu {package} (pip install {package}).") from e
+
+
+def _normalize_header(name):
+    name = str(name or "").strip().lower()
+    return COLUMN_ALIASES.get(name, name)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _detect_encoding(file):
+    # eksporty polskiego Excela zapisują CSV w Windows-1250
+    start = file.tell()
+    sample = file.read(1024 * 1024)
+    file.seek(start)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1250"
+
+
+def _read_xlsx(file):
+    openpyxl = _require("openpyxl", "openpyxl")
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        raise DataImportError("Plik nie jest poprawnym arkuszem XLSX.") from e
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_normalize_header(h) for h in next(rows, [])]
+        for values in rows:
+            if any(v is not None for v in values):
+                yield {h: _cell(v) for h, v in zip(header, values)}
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        raise DataImportError("Nie udało się odczytać arkusza XLSX.") from e
+    finally:
+        workbook.close()
+
+
+def _read_csv(file, encoding):
+    text = io.TextIOWrapper(file, encoding=encoding or _detect_encoding(file), newline="")
+    try:
+        sample = text.readline()
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        header = [_normalize_header(h) for h in next(csv.reader([sample], dialect))]
+        for values in reader:
+            if any(values):
+                yield {h: _cell(v) for h, v in zip(header, values)}
+    except UnicodeDecodeError as e:
+        raise DataImportError(f"Nie można odczytać pliku w kodowaniu {text.encoding} – wybierz inne kodowanie.") from e
+    except csv.Error as e:
+        raise DataImportError(f"Niepoprawny plik CSV: {e}") from e
+    finally:
+        text.detach()
+
+
+def read_rows(file, filename, encoding=None):
+    """Generator słowników z pliku CSV lub XLSX (obiekt plikowy otwarty binarnie).
+
+    Bez ``encoding`` kodowanie CSV (UTF-8 lub Windows-1250) wykrywane jest z początku pliku.
+    """
+    if filename.lower().endswith(".xlsx"):
+        return _read_xlsx(file)
+    return _read_csv(file, encoding)
+
+
+def _row_pesel(row):
+    # arkusze zapisują PESEL jako liczbę i gubią wiodące zera (urodzeni 1900-1909, 2000-2009)
+    pesel = normalize_pesel(row.get("pesel", ""))
+    return pesel.zfill(11) if pesel.isdigit() else pesel
+
+
+def _parse_date(value):
+    for fmt in ("%d.%m.%Y %H:%M", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, fmt).isoformat()
+        except ValueError:
+            pass
+    return datetime.fromisoformat(value).isoformat()
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _new_report():
+    return {"processed": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": []}
+
+
+def _reject(report, row_no, reason):
+    report["invalid"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append((row_no, reason))
+
+
+def _existing_bidx(c, bidx_values):
+    if not bidx_values:
+        return {}
+    placeholders = ", ".join("?" * len(bidx_values))
+    c.execute(f"SELECT pesel_bidx, id FROM patients WHERE pesel_bidx IN ({placeholders})", list(bidx_values))
+    return dict(c.fetchall())
+
+
+def import_patients(rows, chunk_size=CHUNK_SIZE, progress=None):
+    """Importuje pacjentów; ``progress(report)`` wywoływane jest po każdej paczce.
+
+    Numer wiersza w raporcie błędów liczony jest od 2 (wiersz 1 to nagłówek).
+    """
+    report = _new_report()
+    seen = set()
+    created_at = datetime.now().isoformat()
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        for chunk in _chunks(enumerate(rows, start=2), chunk_size):
+            candidates = []
+            for row_no, row in chunk:
+                report["processed"] += 1
+                if not row.get("first_name") or not row.get("last_name"):
+                    _reject(report, row_no, "Brak imienia lub nazwiska.")
+                    continue
+                pesel = _row_pesel(row)
+                if not validate_pesel(pesel):
+                    _reject(report, row_no, f"Niepoprawny PESEL: {pesel or '(brak)'}")
+                    continue
+                bidx = blind_index(pesel)
+                if bidx in seen:
+                    report["duplicates"] += 1
+                    continue
+                seen.add(bidx)
+                candidates.append((bidx, pesel, row))
+
+            existing = _existing_bidx(c, [bidx for bidx, _, _ in candidates])
+            params = [
+                (
+                    row["first_name"],
+                    row["last_name"],
+                    *encrypt_values((pesel, row.get("address"), row.get("phone"), row.get("email"))),
+                    created_at,
+                    bidx,
+                )
+                for bidx, pesel, row in candidates
+                if bidx not in existing
+            ]
+            # OR IGNORE: pacjent dodany równolegle po sprawdzeniu też liczy się jako duplikat
+            changes_before = conn.total_changes
+            with conn:
+                c.executemany(
+                    """
+                    INSERT OR IGNORE INTO patients
+                        (first_name, last_name, pesel, address, phone, email, created_at, pesel_bidx)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    params,
+                )
+            inserted = conn.total_changes - changes_before
+            report["inserted"] += inserted
+            report["duplicates"] += len(candidates) - inserted
+            if progress:
+                progress(report)
+    except DataImportError as e:
+        e.report = report
+        raise
+    except sqlite3.Error as e:
+        raise DataImportError(f"Błąd zapisu do bazy: {e}", report) from e
+    finally:
+        conn.close()
+    return report
+
+
+def _visit_key(patient_id, visit_date, texts):
+    digest = hashlib.sha256("\x1f".join(t or "" for t in texts).encode("utf-8")).hexdigest()
+    return patient_id, visit_date, digest
+
+
+def _existing_visit_keys(c, patient_ids, dates):
+    if not patient_ids:
+        return set()
+    placeholders = ", ".join("?" * len(patient_ids))
+    c.execute(
+        f"""
+        SELECT patient_id, date, interview, examination, medications, recommendations
+        FROM visits
+        WHERE patient_id IN ({placeholders}) AND date BETWEEN ? AND ?
+        """,
+        [*patient_ids, min(dates), max(dates)],
+    )
+    return {
+        _visit_key(patient_id, visit_date, [decrypt(t) for t in texts])
+        for patient_id, visit_date, *texts in c.fetchall()
+    }
+
+
+def import_visits(rows, chunk_size=CHUNK_SIZE, progress=None):
+    """Importuje wizyty; pacjent wskazywany jest kolumną ``pesel``.
+
+    Wizyta o tej samej dacie i treści co istniejąca (lub wcześniejsza w pliku)
+    jest liczona jako duplikat, więc ponowny import tego samego pliku niczego nie dubluje.
+    """
+    report = _new_report()
+    seen = set()
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        for chunk in _chunks(enumerate(rows, start=2), chunk_size):
+            candidates = []
+            for row_no, row in chunk:
+                report["processed"] += 1
+                pesel = _row_pesel(row)
+                if not validate_pesel(pesel):
+                    _reject(report, row_no, f"Niepoprawny PESEL: {pesel or '(brak)'}")
+                    continue
+                try:
+                    visit_date = _parse_date(row.get("date", ""))
+                except ValueError:
+                    _reject(report, row_no, f"Niepoprawna data: {row.get('date') or '(brak)'}")
+                    continue
+                candidates.append((row_no, blind_index(pesel), visit_date, row))
+
+            patient_ids = _existing_bidx(c, {bidx for _, bidx, _, _ in candidates})
+            existing = _existing_visit_keys(
+                c,
+                {patient_ids[bidx] for _, bidx, _, _ in candidates if bidx in patient_ids},
+                [visit_date for _, _, visit_date, _ in candidates],
+            )
+            params = []
+            for row_no, bidx, visit_date, row in candidates:
+                if bidx not in patient_ids:
+                    _reject(report, row_no, "Brak pacjenta o tym numerze PESEL.")
+                    continue
+                texts = tuple(row.get(col) for col in VISIT_ENCRYPTED_COLUMNS)
+                key = _visit_key(patient_ids[bidx], visit_date, texts)
+                if key in existing or key in seen:
+                    report["duplicates"] += 1
+                    continue
+                seen.add(key)
+                params.append((patient_ids[bidx], visit_date, *encrypt_values(texts)))
+
+            with conn:
+                c.executemany(
+                    """
+                    INSERT INTO visits (patient_id, date, interview, examination, medications, recommendations)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    params,
+                )
+            report["inserted"] += len(params)
+            if progress:
+                progress(report)
+    except DataImportError as e:
+        e.report = report
+        raise
+    except sqlite3.Error as e:
+        raise DataImportError(f"Błąd zapisu do bazy: {e}", report) from e
+    finally:
+        conn.close()
+    return report
+
+
+def export_row_count(table):
+    if table not in EXPORT_QUERIES:
+        raise KeyError(table)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iter_export(table, chunk_size=CHUNK_SIZE):
+    """Generator paczek (nagłówki, wiersze) z odszyfrowanymi kolumnami."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        c.execute(EXPORT_QUERIES[table])
+        columns = [d[0] for d in c.description]
+        encrypted = set(PATIENT_ENCRYPTED_COLUMNS + VISIT_ENCRYPTED_COLUMNS)
+        encrypted = [i for i, col in enumerate(columns) if col in encrypted]
+        empty = True
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                if empty:
+                    yield columns, []
+                return
+            empty = False
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for i in encrypted:
+                    row[i] = decrypt(row[i])
+            yield columns, rows
+    finally:
+        conn.close()
+
+
+def export_csv(table, out, chunk_size=CHUNK_SIZE):
+    """Zapisuje tabelę do pliku tekstowego ``out`` w formacie CSV; zwraca liczbę wierszy."""
+    writer = csv.writer(out)
+    count = 0
+    for columns, rows in iter_export(table, chunk_size):
+        if count == 0:
+            writer.writerow(columns)
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def export_parquet(table, out, chunk_size=CHUNK_SIZE):
+    """Zapisuje tabelę do pliku Parquet (jedna grupa wierszy na paczkę); zwraca liczbę wierszy."""
+    pa = _require("pyarrow", "pyarrow")
+    pq = _require("pyarrow.parquet", "pyarrow")
+
+    writer = None
+    count = 0
+    try:
+        for columns, rows in iter_export(table, chunk_size):
+            if writer is None:
+                schema = pa.schema([(col, pa.int64() if col == "id" else pa.string()) for col in columns])
+                writer = pq.ParquetWriter(out, schema)
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
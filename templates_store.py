@@ -0,0 +1,136 @@
+import re
+import sqlite3
+import threading
+
+from db import DB_PATH, run_query
+
+TEMPLATE_TYPES = ["interview", "examination", "recommendations"]
+
+# Zmienne dostępne w treści szablonu, np. "Pacjent {imie} {nazwisko}, wizyta {data}."
+_VAR_RE = re.compile(r"\{(\w+)\}")
+
+_lock = threading.Lock()
+_cache = {"version": 0, "loaded": -1, "templates": {}, "by_type": {}, "shadowed": []}
+
+
+def _load():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT id, type, name, content FROM templates ORDER BY type, name, id")
+        rows = c.fetchall()
+    finally:
+        conn.close()
+
+    templates = {}
+    by_type = {t: [] for t in TEMPLATE_TYPES}
+    # starsze szablony o tej samej nazwie i rodzaju (mogły powstać przed sprawdzaniem duplikatów)
+    shadowed = []
+    for tpl_id, t_type, name, content in rows:
+        tpl = {"id": tpl_id, "type": t_type, "name": name, "content": content}
+        if (t_type, name) in templates:
+            shadowed.append(templates[(t_type, name)])
+        else:
+            by_type.setdefault(t_type, []).append(name)
+        templates[(t_type, name)] = tpl
+    return templates, by_type, shadowed
+
+
+def _snapshot():
+    with _lock:
+        if _cache["loaded"] != _cache["version"]:
+            _cache["templates"], _cache["by_type"], _cache["shadowed"] = _load()
+            _cache["loaded"] = _cache["version"]
+        return _cache["templates"], _cache["by_type"], _cache["shadowed"]
+
+
+def invalidate():
+    with _lock:
+        _cache["version"] += 1
+
+
+def all_templates():
+    """Wszystkie szablony jako słownik {(type, name): template}."""
+    return _snapshot()[0]
+
+
+def duplicate_templates():
+    """Starsze kopie szablonów przesłonięte nowszym o tej samej nazwie i rodzaju."""
+    return list(_snapshot()[2])
+
+
+def template_names(t_type):
+    return list(_snapshot()[1].get(t_type, []))
+
+
+def get_template(t_type, name):
+    return _snapshot()[0].get((t_type, name))
+
+
+def _write_unique(t_type, name, template_id, query, params):
+    # BEGIN IMMEDIATE blokuje zapis innym sesjom między sprawdzeniem nazwy a zapisem
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "SELECT 1 FROM templates WHERE type = ? AND name = ? AND id IS NOT ?",
+                (t_type, name, template_id),
+            )
+            if c.fetchone() is not None:
+                raise ValueError(f"Szablon „{name}” już istnieje.")
+            c.execute(query, params)
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+    finally:
+        conn.close()
+    invalidate()
+
+
+def add_template(t_type, name, content):
+    _write_unique(
+        t_type,
+        name,
+        None,
+        "INSERT INTO templates (type, name, content) VALUES (?, ?, ?)",
+        (t_type, name, content),
+    )
+
+
+def update_template(template_id, t_type, name, content):
+    _write_unique(
+        t_type,
+        name,
+        template_id,
+        "UPDATE templates SET type = ?, name = ?, content = ? WHERE id = ?",
+        (t_type, name, content, template_id),
+    )
+
+
+def delete_template(template_id):
+    run_query("DELETE FROM templates WHERE id = ?", (template_id,))
+    invalidate()
+
+
+def render_template(content, patient=None, visit_date=None):
+    """Podstawia zmienne {imie}, {nazwisko}, {pacjent}, {pesel}, {data}.
+
+    Nieznane zmienne zostają w tekście bez zmian.
+    """
+    values = {}
+    if patient is not None:
+        first_name = getattr(patient, "first_name", "") or ""
+        last_name = getattr(patient, "last_name", "") or ""
+        values.update(
+            imie=first_name,
+            nazwisko=last_name,
+            pacjent=f"{first_name} {last_name}".strip(),
+            pesel=getattr(patient, "pesel", "") or "",
+        )
+    if visit_date is not None:
+        values["data"] = visit_date.strftime("%d.%m.%Y")
+
+    return _VAR_RE.sub(lambda m: str(values.get(m.group(1), m.group(0))), content or "")